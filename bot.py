@@ -6,6 +6,7 @@ from pybit.unified_trading import WebSocket, HTTP
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, CallbackQueryHandler, ContextTypes
 from motor.motor_asyncio import AsyncIOMotorClient
+from logs import setup_logging
 
 load_dotenv()
 TOKEN=os.getenv("TELEGRAM_TOKEN","")
@@ -16,10 +17,14 @@ MONGO_URI=os.getenv("MONGO_URI","")
 DB_NAME=os.getenv("DB_NAME","bybit_bot")
 BYBIT_SETTLE=os.getenv("BYBIT_SETTLE","USDT").upper()
 LOG_LEVEL=os.getenv("LOG_LEVEL","INFO").upper()
+LOG_FORMAT=os.getenv("LOG_FORMAT","json").lower()          # json | text
+LOG_QUEUE_SIZE=int(os.getenv("LOG_QUEUE_SIZE","10000"))
+LOG_RATE_WINDOW=float(os.getenv("LOG_RATE_WINDOW","60"))   # сек
+LOG_RATE_BURST=int(os.getenv("LOG_RATE_BURST","10"))       # записей одного ключа за окно без сэмплинга
+LOG_SAMPLE_EVERY=int(os.getenv("LOG_SAMPLE_EVERY","100"))  # сверх burst — каждая N-я, 0 = ни одной
 STATS_TZ_HOURS=int(os.getenv("STATS_TZ_HOURS","3"))  # МСК по умолчанию
 
-logging.basicConfig(level=getattr(logging,LOG_LEVEL,logging.INFO),
-                    format="%(asctime)s | %(levelname)s | %(message)s")
+LOG_LISTENER=setup_logging(LOG_LEVEL, LOG_FORMAT, LOG_QUEUE_SIZE, LOG_RATE_WINDOW, LOG_RATE_BURST, LOG_SAMPLE_EVERY)
 
 msg_queue:asyncio.Queue=asyncio.Queue()
 deal_seq=80000
@@ -140,13 +145,14 @@ def kb(enabled: bool):
         [InlineKeyboardButton(t, callback_data=("notify_off" if enabled else "notify_on"))]
     ])
 
-async def broadcast(app:Application, text:str):
+async def broadcast(app:Application, text:str, deal:int|None=None, symbol:str|None=None):
     cur = coll_subs.find({"enabled":True})
     async for sub in cur:
         try:
             await app.bot.send_message(chat_id=sub["chat_id"], text=text, reply_markup=kb(True))
         except Exception as e:
-            logging.warning("Broadcast failed: %s", e)
+            logging.warning("Broadcast failed: %s", e,
+                            extra={"deal":deal,"symbol":symbol,"chat_id":sub["chat_id"]})
 
 # WS → очередь
 def _put_from_thread(item):
@@ -305,15 +311,16 @@ async def _apply_pending_to_deal(symbol:str, deal_id:int):
 async def queue_consumer(app:Application,http:HTTP):
     logging.info("Queue consumer started")
     while True:
+        topic=None
         try:
             topic,msg=await msg_queue.get()
             if topic=="position":
                 await on_position(app,msg)
             elif topic=="execution":
+                symbols=set()
                 try:
                     data = msg.get("data", [])
                     if isinstance(data, dict): data = [data]
-                    symbols=set()
                     for r in data:
                         sym = r.get("symbol")
                         if sym: symbols.add(sym)
@@ -370,9 +377,10 @@ async def queue_consumer(app:Application,http:HTTP):
                     for s in symbols:
                         await fetch_symbol_and_process(app,http,s)
                 except Exception as e:
-                    logging.warning("Execution follow-up failed: %s", e)
+                    logging.warning("Execution follow-up failed: %s", e,
+                                    extra={"symbol":",".join(sorted(symbols)) or None})
         except Exception as e:
-            logging.error("Queue consumer error: %s", e)
+            logging.error("Queue consumer error: %s", e, extra={"topic":topic})
 
 # ───────────────────────── events ─────────────────────────
 
@@ -447,7 +455,7 @@ async def on_position(app:Application,msg:dict):
                 f"{line('Номинал', nt_str)}"
             )
             await save_event("open",symbol,side,size,avg,lev,deal_seq)
-            await broadcast(app,txt)
+            await broadcast(app,txt,deal=deal_seq,symbol=symbol)
             continue
 
         if increased:
@@ -477,7 +485,7 @@ async def on_position(app:Application,msg:dict):
                 f"{line('Плечо', fmt_lev(lev))}"
             )
             await save_event("partial",symbol,side,size,avg,lev,deal_id,percent=closed_pct)
-            await broadcast(app,txt)
+            await broadcast(app,txt,deal=deal_id,symbol=symbol)
             continue
 
         if closed_full:
@@ -527,7 +535,7 @@ async def on_position(app:Application,msg:dict):
                  f"Позиция закрыта полностью\n"
                  f"{line('PNL', fmt_usd_signed(pnl_calc) if pnl_calc is not None else '—')}")
             await save_event("close",symbol,prev_side,Decimal("0"),avg,lev,deal_id)
-            await broadcast(app,txt)
+            await broadcast(app,txt,deal=deal_id,symbol=symbol)
             continue
 
         # обычное обновление позиции
@@ -556,7 +564,7 @@ async def fetch_symbol_and_process(app:Application,http:HTTP,symbol:str):
         if rows:
             await on_position(app,{"topic":"position","data":rows})
     except Exception as e:
-        logging.warning("Fetch positions for %s failed: %s", symbol, e)
+        logging.warning("Fetch positions for %s failed: %s", symbol, e, extra={"symbol":symbol})
 
 # ───────────────────────── lifecycle ─────────────────────────
 
@@ -0,0 +1,399 @@
+# Нагрузочный стенд: синтетические позиции/исполнения Bybit → ws_pos/ws_exec → queue_consumer
+# → broadcast → локальный фейковый Telegram Bot API с M подписчиками.
+#
+#   python loadtest.py --rates 5,20,50 --subs 10,100,500 --duration 20
+#
+# Нужен MongoDB: --mongo-uri, по умолчанию локальный mongodb://localhost:27017. MONGO_URI из .env
+# намеренно не используется — база --db при каждом прогоне удаляется. Bybit и Telegram в сеть не ходят.
+
+import json, time, uuid, math, random, asyncio, argparse, threading, logging, re
+from collections import deque
+from decimal import Decimal, ROUND_DOWN
+from urllib.parse import parse_qsl
+from telegram.ext import Application
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import bot
+
+LOT=Decimal("0.01")
+SYMBOL_RE=re.compile(r"^(?:BUY|SELL) (\S+)$", re.M)
+SIZE_RE=re.compile(r"^(?:Размер|Осталось): (\S+)$", re.M)
+
+# ───────────────────────── stats ─────────────────────────
+
+class LoadStats:
+    """Сопоставление сигналов с исполнениями идёт по FIFO на символ.
+
+    Бот может показать не каждое состояние: fetch_symbol_and_process читает уже ушедший
+    вперёд снимок и склеивает несколько переходов в один сигнал. Поэтому сигнал забирает
+    из очереди символа все переходы до состояния с тем же размером включительно, а задержка
+    считается от самого старого из забранных сигнальных переходов — склеенные не теряются
+    и не занижают задержку, а считаются в merged."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.fills=0
+            self.expected_signals=0
+            self.merged=0
+            self.pending: dict[str, deque] = {}   # symbol → (размер, t отправки в ws_*, сигнальный ли переход)
+            self.signals: dict[str, list] = {}    # текст сигнала → [t_inj | None, t_first, t_last]
+            self.sends: list[float] = []
+            self.depth: list[int] = []
+
+    def inject(self, symbol: str, size: str, signal: bool, now: float):
+        with self.lock:
+            self.fills += 1
+            if signal:
+                self.expected_signals += 1
+            self.pending.setdefault(symbol, deque()).append((size, now, signal))
+
+    def _match(self, symbol: str, size: str) -> float | None:
+        q = self.pending.get(symbol)
+        if not q or all(e[0] != size for e in q):
+            return None   # состояние не из очереди (например, запоздавший ws_pos откатил позицию назад)
+        t_ref, taken = None, 0
+        while True:
+            sz, t, sig = q.popleft()
+            if sig:
+                taken += 1
+                if t_ref is None:
+                    t_ref = t
+            if sz == size:
+                self.merged += max(0, taken-1)
+                return t if t_ref is None else t_ref
+
+    def unsignalled(self) -> int:
+        with self.lock:
+            return sum(1 for q in self.pending.values() for e in q if e[2])
+
+    def on_send(self, text: str, now: float):
+        with self.lock:
+            self.sends.append(now)
+            sig = self.signals.get(text)
+            if sig is not None:
+                sig[2] = now
+                return
+            m = SYMBOL_RE.search(text)
+            s = SIZE_RE.search(text)
+            t_inj = self._match(m.group(1), s.group(1) if s else "0") if m else None
+            self.signals[text] = [t_inj, now, now]
+
+def _pct(vals: list[float], p: float) -> float | None:
+    if not vals:
+        return None
+    vals = sorted(vals)
+    return vals[min(len(vals), max(1, math.ceil(p/100*len(vals))))-1]
+
+def _ms(v: float | None) -> str:
+    return "—" if v is None else f"{v*1000:.0f}"
+
+# ───────────────────────── fake Telegram Bot API ─────────────────────────
+
+class FakeTelegram:
+    def __init__(self, stats: LoadStats, latency: float = 0.0):
+        self.stats = stats
+        self.latency = latency
+        self.port = 0
+        self._server = None
+        self._msg_id = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logging.info("Fake Telegram API on 127.0.0.1:%s", self.port)
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/bot"
+
+    @staticmethod
+    def _params(ctype: str, body: bytes) -> dict:
+        if not body:
+            return {}
+        if "json" in ctype:
+            return json.loads(body)
+        return dict(parse_qsl(body.decode()))
+
+    def _dispatch(self, api: str, p: dict):
+        if api == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "load", "username": "load_bot"}
+        if api == "sendMessage":
+            self._msg_id += 1
+            text = p.get("text", "")
+            self.stats.on_send(text, time.perf_counter())
+            return {"message_id": self._msg_id, "date": int(time.time()),
+                    "chat": {"id": int(p.get("chat_id", 0)), "type": "private"}, "text": text}
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1").split("\r\n")
+                path = head[0].split(" ")[1]
+                headers = {k.strip().lower(): v.strip() for k, v in (h.split(":", 1) for h in head[1:] if ":" in h)}
+                n = int(headers.get("content-length", "0") or 0)
+                body = await reader.readexactly(n) if n else b""
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                result = self._dispatch(path.rsplit("/", 1)[-1], self._params(headers.get("content-type", ""), body))
+                data = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n" % len(data) + data)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+# ───────────────────────── synthetic Bybit ─────────────────────────
+
+class SymbolBook:
+    """Состояние одной синтетической позиции: открытие → доборы → частичные → полное закрытие."""
+
+    def __init__(self, symbol: str, price: Decimal):
+        self.symbol = symbol
+        self.price = price
+        self.side = ""
+        self.size = Decimal("0")
+        self.avg = Decimal("0")
+        self.scale_ins = 0
+
+    def position_row(self) -> dict:
+        return {"category": "linear", "symbol": self.symbol, "side": self.side,
+                "size": f"{self.size:f}", "avgPrice": f"{self.avg:f}", "markPrice": f"{self.price:f}",
+                "positionValue": f"{(self.size*self.avg).quantize(Decimal('0.01'), rounding=ROUND_DOWN):f}",
+                "leverage": "10"}
+
+    def step(self, rng: random.Random) -> tuple[str, dict]:
+        self.price = (self.price * Decimal(str(1 + rng.gauss(0, 0.001)))).quantize(Decimal("0.0001"))
+        if self.size == 0:
+            kind = "open"
+            self.side = rng.choice(("Buy", "Sell"))
+            qty = LOT * rng.randint(10, 500)
+            self.size, self.avg, self.scale_ins = qty, self.price, 0
+            exec_side = self.side
+        else:
+            r = rng.random()
+            if r < 0.3 and self.scale_ins < 3:
+                kind = "scale_in"
+                qty = LOT * rng.randint(5, 200)
+                self.avg = ((self.avg*self.size + self.price*qty) / (self.size+qty)).quantize(Decimal("0.0001"))
+                self.size += qty
+                self.scale_ins += 1
+                exec_side = self.side
+            elif r < 0.75 and self.size >= 2*LOT:
+                kind = "partial"
+                qty = max(LOT, (self.size * Decimal(str(rng.uniform(0.1, 0.6)))).quantize(LOT, rounding=ROUND_DOWN))
+                self.size -= qty
+                exec_side = "Sell" if self.side == "Buy" else "Buy"
+            else:
+                kind = "close"
+                qty = self.size
+                exec_side = "Sell" if self.side == "Buy" else "Buy"
+                self.side, self.size, self.avg = "", Decimal("0"), Decimal("0")
+        value = (qty * self.price).quantize(Decimal("0.01"), rounding=ROUND_DOWN)
+        exec_row = {"category": "linear", "symbol": self.symbol, "side": exec_side,
+                    "execId": str(uuid.uuid4()), "execQty": f"{qty:f}", "execPrice": f"{self.price:f}",
+                    "execValue": f"{value:f}", "execFee": f"{(value*Decimal('0.00055')).quantize(Decimal('0.0001')):f}",
+                    "execTime": str(int(time.time()*1000))}
+        return kind, exec_row
+
+class FakeBybitHTTP:
+    """Подмена pybit HTTP: get_positions отдаёт текущее состояние синтетических позиций."""
+
+    def __init__(self, books: dict[str, SymbolBook], lock: threading.Lock, latency: float = 0.0):
+        self.books = books
+        self.lock = lock
+        self.latency = latency
+
+    def get_positions(self, category="linear", symbol=None, settleCoin=None, **kwargs):
+        if self.latency:
+            time.sleep(self.latency)  # как и настоящий pybit — блокирует цикл
+        with self.lock:
+            rows = [b.position_row() for s, b in self.books.items() if symbol in (None, s)]
+        return {"retCode": 0, "result": {"list": rows}}
+
+def generator(books: dict[str, SymbolBook], lock: threading.Lock, stats: LoadStats,
+              rate: float, duration: float, stop: threading.Event, seed: int):
+    # отдельный поток, как у pybit WebSocket: ws_* → call_soon_threadsafe
+    rng = random.Random(seed)
+    symbols = list(books)
+    t_next = time.perf_counter()
+    t_end = t_next + duration
+    while not stop.is_set() and t_next < t_end:
+        delay = t_next - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        book = books[rng.choice(symbols)]
+        with lock:
+            kind, exec_row = book.step(rng)
+            pos_row = book.position_row()
+        stats.inject(book.symbol, bot.fmt_qty(pos_row["size"]), kind != "scale_in", time.perf_counter())
+        bot.ws_exec({"topic": "execution", "creationTime": int(time.time()*1000), "data": [exec_row]})
+        bot.ws_pos({"topic": "position", "creationTime": int(time.time()*1000), "data": [pos_row]})
+        t_next += 1.0 / rate
+
+# ───────────────────────── run ─────────────────────────
+
+async def _reset_db(client: AsyncIOMotorClient, db_name: str, subs: int):
+    await client.drop_database(db_name)
+    db = client[db_name]
+    bot.db = db
+    bot.coll_pos = db["positions"]
+    bot.coll_ev = db["events"]
+    bot.coll_cfg = db["config"]
+    bot.coll_subs = db["subscribers"]
+    bot.coll_deals = db["deals"]
+    await bot.coll_ev.create_index([("t",1)])
+    await bot.coll_subs.create_index("chat_id", unique=True)
+    await bot.coll_deals.create_index([("status",1),("end_ts",-1)])
+    await bot.coll_deals.create_index("deal", unique=True)
+    now = int(time.time())
+    await bot.coll_subs.insert_many([{"chat_id": 1000+i, "enabled": True, "created_at": now} for i in range(subs)])
+
+    bot.deal_seq = 80000
+    bot.LAST_EXEC_PRICE.clear()
+    bot.PENDING_EXEC.clear()
+    while not bot.msg_queue.empty():
+        bot.msg_queue.get_nowait()
+
+async def run_point(app: Application, client: AsyncIOMotorClient, stats: LoadStats, args,
+                    rate: float, subs: int) -> dict:
+    await _reset_db(client, args.db, subs)
+    stats.reset()
+
+    rng = random.Random(args.seed)
+    books = {f"LT{i:03d}USDT": SymbolBook(f"LT{i:03d}USDT", Decimal(str(round(rng.uniform(0.5, 500), 4))))
+             for i in range(args.symbols)}
+    lock = threading.Lock()
+    http = FakeBybitHTTP(books, lock, args.bybit_latency)
+    consumer = asyncio.create_task(bot.queue_consumer(app, http))
+
+    async def sample():
+        while True:
+            stats.depth.append(bot.msg_queue.qsize())
+            await asyncio.sleep(0.1)
+    sampler = asyncio.create_task(sample())
+
+    stop = threading.Event()
+    t0 = time.perf_counter()
+    await asyncio.to_thread(generator, books, lock, stats, rate, args.duration, stop, args.seed)
+    t_gen = time.perf_counter()
+    depth_at_end = bot.msg_queue.qsize()
+
+    # ждём, пока очередь разберётся и рассылка затихнет
+    while time.perf_counter() - t_gen < args.drain_timeout:
+        last = stats.sends[-1] if stats.sends else t_gen
+        if bot.msg_queue.empty() and time.perf_counter() - last > 0.5:
+            break
+        await asyncio.sleep(0.1)
+    t_done = time.perf_counter()
+    sampler.cancel()
+    consumer.cancel()
+    await asyncio.gather(sampler, consumer, return_exceptions=True)
+
+    first = [s[1]-s[0] for s in stats.signals.values() if s[0] is not None]
+    last = [s[2]-s[0] for s in stats.signals.values() if s[0] is not None]
+    sends = stats.sends
+    per_sec: dict[int, int] = {}
+    for t in sends:
+        per_sec[int(t - t0)] = per_sec.get(int(t - t0), 0) + 1
+    return {
+        "rate": rate, "subs": subs, "fills": stats.fills,
+        "signals_expected": stats.expected_signals, "signals_seen": len(stats.signals),
+        "signals_sampled": len(first),
+        "signals_merged": stats.merged + stats.unsignalled(),
+        "sends": len(sends),
+        "sends_per_s": len(sends) / max(t_done - t0, 1e-9),
+        "sends_per_s_peak": max(per_sec.values(), default=0),
+        "queue_max": max(stats.depth, default=0),
+        "queue_mean": sum(stats.depth) / len(stats.depth) if stats.depth else 0.0,
+        "queue_at_gen_end": depth_at_end,
+        "backlog_left": bot.msg_queue.qsize(),
+        "drain_s": (t_done - t_gen) if bot.msg_queue.empty() else None,
+        "latency_first": {p: _pct(first, p) for p in (50, 95, 99, 100)},
+        "latency_last": {p: _pct(last, p) for p in (50, 95, 99, 100)},
+    }
+
+def print_report(rows: list[dict]):
+    hdr = (f"{'rate':>6} {'subs':>6} {'fills':>6} {'sig exp/seen/lat':>17} {'merged':>6} {'sends':>7} {'send/s':>7} {'peak':>6} "
+           f"{'q max':>6} {'q end':>6} {'drain s':>8} "
+           f"{'1st p50':>8} {'p95':>6} {'p99':>6} {'all p50':>8} {'p95':>6} {'p99':>6} {'max':>6}")
+    print("\nlatency: ws_* → первое (1st) / последнее (all) сообщение рассылки, мс")
+    print("sig: ожидалось / разослано / с замером задержки; merged — переходы, склеенные в более поздний сигнал или не разосланные")
+    print(hdr)
+    print("─" * len(hdr))
+    for r in rows:
+        lf, ll = r["latency_first"], r["latency_last"]
+        drain = "—" if r["drain_s"] is None else f"{r['drain_s']:.1f}"
+        print(f"{r['rate']:>6g} {r['subs']:>6} {r['fills']:>6} "
+              f"{'/'.join(str(r[k]) for k in ('signals_expected','signals_seen','signals_sampled')):>17} "
+              f"{r['signals_merged']:>6} {r['sends']:>7} "
+              f"{r['sends_per_s']:>7.0f} {r['sends_per_s_peak']:>6} {r['queue_max']:>6} {r['queue_at_gen_end']:>6} "
+              f"{drain:>8} {_ms(lf[50]):>8} {_ms(lf[95]):>6} {_ms(lf[99]):>6} "
+              f"{_ms(ll[50]):>8} {_ms(ll[95]):>6} {_ms(ll[99]):>6} {_ms(ll[100]):>6}")
+
+async def amain(args):
+    if args.db == bot.DB_NAME:
+        raise SystemExit(f"--db совпадает с рабочей базой {bot.DB_NAME!r}, она будет удалена — выбери другую")
+
+    stats = LoadStats()
+    tg = FakeTelegram(stats, args.tg_latency)
+    await tg.start()
+    client = AsyncIOMotorClient(args.mongo_uri, uuidRepresentation="standard")
+    await client[args.db].command("ping")
+
+    bot.MAIN_LOOP = asyncio.get_running_loop()
+    app = Application.builder().token("1:load").base_url(tg.base_url).build()
+    await app.initialize()
+
+    rows = []
+    try:
+        for rate in args.rates:
+            for subs in args.subs:
+                logging.info("Load point rate=%s/s subs=%s duration=%ss", rate, subs, args.duration)
+                rows.append(await run_point(app, client, stats, args, rate, subs))
+    finally:
+        await app.shutdown()
+        await client.drop_database(args.db)
+        client.close()
+        await tg.stop()
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+
+def _floats(s: str) -> list[float]:
+    return [float(x) for x in s.split(",") if x.strip()]
+
+def _ints(s: str) -> list[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main():
+    p = argparse.ArgumentParser(description="Load sweep: fills/s × subscribers")
+    p.add_argument("--rates", type=_floats, default=[5.0, 20.0, 50.0], help="исполнений в секунду, через запятую")
+    p.add_argument("--subs", type=_ints, default=[10, 100, 500], help="число подписчиков, через запятую")
+    p.add_argument("--duration", type=float, default=20.0, help="секунд генерации на точку")
+    p.add_argument("--drain-timeout", type=float, default=60.0, help="сколько ждать разбора очереди после генерации")
+    p.add_argument("--symbols", type=int, default=30)
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--tg-latency", type=float, default=0.0, help="задержка ответа фейкового Telegram, сек")
+    p.add_argument("--bybit-latency", type=float, default=0.0, help="задержка get_positions, сек")
+    p.add_argument("--mongo-uri", default="mongodb://localhost:27017",
+                   help="MongoDB стенда; MONGO_URI из окружения не используется")
+    p.add_argument("--db", default="bybit_bot_load")
+    p.add_argument("--json", help="куда сохранить отчёт в JSON")
+    asyncio.run(amain(p.parse_args()))
+
+if __name__=="__main__":
+    main()
@@ -0,0 +1,197 @@
+import time, copy, json, queue, threading, atexit, logging, logging.handlers
+from datetime import datetime, timezone as dt_tz
+
+# Запись из event loop только кладётся в очередь; в stderr пишет поток QueueListener.
+
+LOG_FIELDS=("deal","symbol","chat_id","topic","suppressed","dropped")
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        doc={"ts":datetime.fromtimestamp(record.created, dt_tz.utc).isoformat(timespec="milliseconds"),
+             "level":record.levelname,"logger":record.name,"msg":record.getMessage()}
+        for k in LOG_FIELDS:
+            v=getattr(record,k,None)
+            if v is not None:
+                doc[k]=v
+        if record.exc_info and not record.exc_text:
+            record.exc_text=self.formatException(record.exc_info)
+        if record.exc_text:
+            doc["exc"]=record.exc_text
+        if record.stack_info:
+            doc["stack"]=self.formatStack(record.stack_info)
+        return json.dumps(doc, ensure_ascii=False, default=str)
+
+class TextFormatter(logging.Formatter):
+    # поля те же, что в JSON, — хвостом k=v, иначе в текстовом режиме не видно suppressed/dropped
+    def formatMessage(self, record):
+        s=super().formatMessage(record)
+        kv=" ".join(f"{k}={v}" for k in LOG_FIELDS if (v:=getattr(record,k,None)) is not None)
+        return f"{s} | {kv}" if kv else s
+
+class RateLimitFilter(logging.Filter):
+    """Ключ — логгер, уровень, шаблон сообщения и поля symbol/deal. За окно пропускает burst
+    записей, дальше каждую sample_every-ю; сколько отброшено — в поле suppressed следующей записи.
+    chat_id в ключ не входит: при отказе Telegram ошибки по всем чатам одной сделки — один шторм.
+
+    Если ключ больше не пишет (сделка закрыта), неотчитанный остаток уходит в sink отдельной
+    сводной записью при очистке истёкших окон или в flush() на выходе, а ключ удаляется."""
+
+    def __init__(self, window: float, burst: int, sample_every: int, clock=time.monotonic):
+        super().__init__()
+        self.window=window
+        self.burst=burst
+        self.sample_every=sample_every
+        self.sink=None                        # куда отдавать сводные записи, см. setup_logging
+        self._clock=clock
+        self._state: dict[tuple, list] = {}   # key → [начало окна, записей в окне, отброшено]
+        self._lock=threading.Lock()
+        self._swept=clock()
+
+    @staticmethod
+    def _summary(key: tuple, suppressed: int) -> logging.LogRecord:
+        name, level, msg, symbol, deal = key
+        r=logging.LogRecord(name, level, "", 0, msg, None, None)
+        r.symbol, r.deal, r.suppressed = symbol, deal, suppressed
+        return r
+
+    def _expire(self, keep) -> list[logging.LogRecord]:
+        # под self._lock; возвращает сводки по удалённым ключам с неотчитанными пропусками
+        out=[]
+        state={}
+        for k, st in self._state.items():
+            if keep(st):
+                state[k]=st
+            elif st[2]:
+                out.append(self._summary(k, st[2]))
+        self._state=state
+        return out
+
+    def _emit(self, records: list[logging.LogRecord]):
+        if self.sink:
+            for r in records:
+                self.sink(r)
+
+    def flush(self):
+        with self._lock:
+            out=self._expire(lambda st: False)
+        self._emit(out)
+
+    def filter(self, record):
+        key=(record.name, record.levelno, str(record.msg),
+             getattr(record,"symbol",None), getattr(record,"deal",None))
+        now=self._clock()
+        out=[]
+        with self._lock:
+            if now-self._swept>=self.window:
+                out=self._expire(lambda st: now-st[0]<self.window)
+                self._swept=now
+            st=self._state.get(key)
+            if st is None or now-st[0]>=self.window:
+                st=self._state[key]=[now, 0, st[2] if st else 0]
+            st[1]+=1
+            n=st[1]-self.burst
+            if n<=0 or (self.sample_every and n%self.sample_every==0):
+                if st[2]:
+                    record.suppressed=st[2]
+                    st[2]=0
+                passed=True
+            else:
+                st[2]+=1
+                passed=False
+        self._emit(out)
+        return passed
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # при переполнении очереди не блокируемся и не пишем traceback — считаем и сообщаем в dropped
+    def __init__(self, q):
+        super().__init__(q)
+        self.dropped=0
+        self.closed=False                     # после close_queue() записи только считаются в dropped
+        self._dropped_lock=threading.Lock()   # пишут event loop, поток pybit WS и to_thread-воркеры
+
+    def prepare(self, record):
+        # очередь in-process, pickle нет: текст собираем сразу (args могут поменяться),
+        # а exc_info/stack_info оставляем как есть — traceback форматирует поток listener'а
+        record=copy.copy(record)
+        record.message=record.getMessage()
+        record.msg=record.message
+        record.args=None
+        return record
+
+    def close_queue(self):
+        with self._dropped_lock:
+            self.closed=True
+
+    def enqueue(self, record):
+        with self._dropped_lock:
+            if self.closed:
+                self.dropped+=1
+                return
+            d=self.dropped
+            if d:
+                record.dropped=d
+            try:
+                self.queue.put_nowait(record)
+                self.dropped-=d
+            except queue.Full:
+                self.dropped+=1
+
+class DrainingQueueListener(logging.handlers.QueueListener):
+    # stop() кладёт маркер через put_nowait и на полной очереди (шторм при выходе) падает с queue.Full,
+    # а join() без таймаута вешает выход, если поток записи застрял. Сначала закрываем очередь для
+    # producer'а, ждём место под маркер, а если поток не успевает — выкидываем старые записи сами.
+    def __init__(self, q, *handlers, producer: "DroppingQueueHandler | None" = None, timeout: float = 5.0):
+        super().__init__(q, *handlers)
+        self.producer=producer
+        self.timeout=timeout
+
+    def enqueue_sentinel(self):
+        if self.producer:
+            self.producer.close_queue()
+        try:
+            self.queue.put(self._sentinel, timeout=self.timeout)
+            return
+        except queue.Full:
+            pass
+        while True:
+            try:
+                self.queue.put_nowait(self._sentinel)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self.enqueue_sentinel()
+        self._thread.join(self.timeout)
+        self._thread=None
+
+def setup_logging(level: str, fmt: str, queue_size: int, window: float, burst: int,
+                  sample_every: int) -> logging.handlers.QueueListener:
+    out=logging.StreamHandler()
+    if fmt=="json":
+        out.setFormatter(JsonFormatter())
+    else:
+        out.setFormatter(TextFormatter("%(asctime)s | %(levelname)s | %(message)s"))
+    q=queue.Queue(maxsize=queue_size)
+    qh=DroppingQueueHandler(q)
+    rl=RateLimitFilter(window, burst, sample_every)
+    rl.sink=lambda r: qh.enqueue(qh.prepare(r))   # мимо фильтра, иначе сводка заведёт ключ заново
+    qh.addFilter(rl)
+    root=logging.getLogger()
+    root.setLevel(getattr(logging,level,logging.INFO))
+    root.handlers[:]=[qh]
+    # httpx пишет INFO на каждый запрос к Telegram — при рассылке это строка на подписчика
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    listener=DrainingQueueListener(q, out, producer=qh)
+    listener.start()
+
+    def shutdown():
+        rl.flush()
+        listener.stop()
+    atexit.register(shutdown)
+    return listener
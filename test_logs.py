@@ -0,0 +1,88 @@
+import logging
+
+from logs import RateLimitFilter
+
+
+class Clock:
+    def __init__(self):
+        self.t = 1000.0
+
+    def __call__(self):
+        return self.t
+
+
+def rec(msg="Broadcast failed: %s", deal=1, symbol="BTCUSDT", level=logging.WARNING):
+    r = logging.LogRecord("root", level, "", 0, msg, ("err",), None)
+    r.deal, r.symbol = deal, symbol
+    return r
+
+
+def make(window=60, burst=3, sample_every=10):
+    clock = Clock()
+    f = RateLimitFilter(window, burst, sample_every, clock=clock)
+    sunk = []
+    f.sink = sunk.append
+    return f, clock, sunk
+
+
+def test_burst_then_sampling():
+    f, _, _ = make(burst=3, sample_every=10)
+    passed = [i for i in range(30) if f.filter(rec())]
+    # первые 3 без ограничений, дальше каждая 10-я сверх burst
+    assert passed == [0, 1, 2, 12, 22]
+
+
+def test_sampled_record_carries_suppressed_count():
+    f, _, _ = make(burst=1, sample_every=5)
+    records = [rec() for _ in range(11)]
+    passed = [r for r in records if f.filter(r)]
+    assert [getattr(r, "suppressed", None) for r in passed] == [None, 4, 4]
+
+
+def test_suppressed_carried_into_next_window():
+    f, clock, sunk = make(window=10, burst=1, sample_every=0)
+    clock.t += 5
+    for _ in range(5):
+        f.filter(rec())
+    clock.t += 5
+    f.filter(rec(msg="other %s"))   # очистка проходит, окно ключа ещё не истекло
+    clock.t += 5
+    r = rec()
+    assert f.filter(r)
+    assert r.suppressed == 4
+    assert sunk == []
+
+
+def test_keys_include_symbol_and_deal():
+    f, _, _ = make(burst=1, sample_every=0)
+    assert f.filter(rec(deal=1))
+    assert not f.filter(rec(deal=1))
+    assert f.filter(rec(deal=2))
+    assert f.filter(rec(deal=1, symbol="ETHUSDT"))
+
+
+def test_expired_keys_pruned_with_summary():
+    f, clock, sunk = make(window=10, burst=2, sample_every=0)
+    for deal in range(100):
+        for _ in range(5):
+            f.filter(rec(deal=deal))
+    for _ in range(2):
+        f.filter(rec(msg="quiet %s", deal=None))   # в пределах burst — сводка не нужна
+    clock.t += 10
+    assert f.filter(rec(msg="other %s", deal=None))
+
+    assert len(f._state) == 1
+    assert len(sunk) == 100
+    assert sum(r.suppressed for r in sunk) == 300
+    s = sunk[0]
+    assert (s.name, s.levelno, s.msg, s.symbol, s.deal) == ("root", logging.WARNING, "Broadcast failed: %s", "BTCUSDT", 0)
+
+
+def test_flush_reports_and_clears_everything():
+    f, _, sunk = make(burst=1, sample_every=0)
+    for _ in range(4):
+        f.filter(rec(deal=7))
+    f.filter(rec(deal=8))
+    f.flush()
+    assert [(r.deal, r.suppressed) for r in sunk] == [(7, 3)]
+    assert f._state == {}